@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import re
 import logging
 from typing import Tuple, Dict, Any
@@ -20,6 +21,23 @@ from keyboard_builder import KeyboardBuilder
 
 logger = logging.getLogger(__name__)
 
+# Access denial messages (constant, no per-denial formatting)
+NOT_ADMIN_TEXT = "❌ Вы не администратор."
+ADMIN_REQUIRED_TEXT = "🔐 Необходимы права администратора."
+
+def require_admin(handler):
+    """Reply NOT_ADMIN_TEXT and skip the command unless the sender is an admin"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager: ContentManager):
+        user_id, username, _ = get_user_info(update)
+        if not await check_admin_access(content_manager, user_id, username):
+            state = StateManager.create_state(promo_id=0, verified_at=0, status_message_id=0, promo_message_id=0)
+            await show_status(update, state, text=NOT_ADMIN_TEXT)
+            return
+        return await handler(update, context, content_manager)
+
+    return wrapper
+
 # ===== ADMIN COMMANDS =====
 
 async def login_command(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager: ContentManager):
@@ -78,6 +96,7 @@ async def login_command(update: Update, context: ContextTypes.DEFAULT_TYPE, cont
         logger.error(f"Error in login command: {e}")
         await show_status(update, state, text="❌ Ошибка системы авторизации. Попробуйте позже.")
         
+@require_admin
 async def logout_command(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager: ContentManager):
     """Logout command - removes admin privileges by deleting from database
     Usage: /logout or /logout {user_id}"""
@@ -92,11 +111,6 @@ async def logout_command(update: Update, context: ContextTypes.DEFAULT_TYPE, con
         promo_message_id=0  # Will be set when promo is sent
     )
     
-    # Check if user is currently admin
-    if not await check_admin_access(content_manager, user_id, username):
-        await show_status(update, state, text="❌ Вы не администратор.")
-        return
-    
     # Parse target user_id (default to self)
     target_user_id = user_id  # Default to current user
     target_user_str = "self"
@@ -160,12 +174,34 @@ async def logout_command(update: Update, context: ContextTypes.DEFAULT_TYPE, con
             text=f"❌ Ошибка при исключении {target_user_str}. Попробуйте позже."
         )
 
+@require_admin
+async def refresh_command(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager: ContentManager):
+    """Refresh command - reload promos and admins from Google Sheets immediately
+    Usage: /refresh"""
+    log_update(update, "REFRESH COMMAND")
+    
+    user_id, username, _ = get_user_info(update)
+    
+    state = StateManager.create_state(
+        promo_id=0,  # Not needed for refresh
+        verified_at=1,  # Verified - require_admin already checked access
+        status_message_id=0,  # Will be set when status is sent
+        promo_message_id=0  # Not needed for refresh
+    )
+    
+    if await content_manager.refresh_cache(force=True):
+        log_admin_action(user_id, username, "REFRESH_CACHE")
+        status_text = f"🔄 Данные обновлены: {content_manager.total_count} предложений (активно: {content_manager.active_count})"
+    else:
+        status_text = "❌ Не удалось обновить данные. Попробуйте позже."
+    
+    await show_status(update, state, text=status_text)
+
 # ===== INLINE ADMIN HANDLERS =====
 
 async def toggle_view_mode_inline(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager: ContentManager):
     """Admin: Toggle between 'active only' and 'show all' modes"""
     log_update(update, "TOGGLE VIEW MODE")
-    await content_manager.refresh_cache()
     query = update.callback_query
     await query.answer()
     
@@ -204,17 +240,14 @@ async def toggle_view_mode_inline(update: Update, context: ContextTypes.DEFAULT_
 
 async def toggle_promo_status_inline(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager: ContentManager):
     """Admin: Toggle promo status and update current message"""
-    await content_manager.refresh_cache(True)
     query = update.callback_query
     action, state = StateManager.decode_callback_data(query.data)
-    logger.info(f"TOGGLE PROMO STATUS: action={action}, state={state}")
+    logger.info("TOGGLE PROMO STATUS: action=%s, state=%s", action, state)
     
     promo_id = state.promo_id
     
-    # Get all promos to find current promo
-    promos = content_manager.get_all_promos()
-    
-    promo = next((p for p in promos if int(p["id"]) == promo_id), None)
+    # Find current promo
+    promo = content_manager.get_promo_by_id(promo_id)
     if not promo:
         await show_status(update, state, text=f"❌ Предложение {promo_id} не найдено")
         state = await check_promos_available(update, state, content_manager, preserve_position=True)
@@ -249,19 +282,13 @@ async def toggle_promo_status_inline(update: Update, context: ContextTypes.DEFAU
 
 async def delete_promo_inline(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager: ContentManager):
     """Admin: Delete promo with confirmation"""
-    # Force refresh cache to get latest data
-    
     query = update.callback_query
     action, state = StateManager.decode_callback_data(query.data)
-
-    show_status(update, state, "🗑️ Готовимся к удалению...")
-    await content_manager.refresh_cache(True)
     
     promo_id = state.promo_id
     
     # Check if promo still exists
-    promos = content_manager.get_all_promos()
-    promo = next((p for p in promos if int(p["id"]) == promo_id), None)
+    promo = content_manager.get_promo_by_id(promo_id)
     if not promo:
         await show_status(update, state, f"❌ Предложение {promo_id} не найдено")
         
@@ -285,7 +312,6 @@ async def confirm_delete_promo(update: Update, context: ContextTypes.DEFAULT_TYP
     action, state = StateManager.decode_callback_data(query.data)
 
     show_status(update, state, "🗑️ Удаляем...")
-    await content_manager.refresh_cache(True)
     
     promo_id = state.promo_id
     
@@ -318,8 +344,7 @@ async def edit_promo_inline(update: Update, context: ContextTypes.DEFAULT_TYPE,
     promo_id = state.promo_id
     
     # Get the promo data
-    all_promos = content_manager.get_all_promos()
-    promo = next((p for p in all_promos if p["id"] == promo_id), None)
+    promo = content_manager.get_promo_by_id(promo_id)
     
     if not promo:
         await show_status(update, state, text=f"❌ Предложение {promo_id} не найдено")
@@ -420,7 +445,7 @@ async def admin_message_handler(update: Update, context: ContextTypes.DEFAULT_TY
     )
     
     # Get current state (admin should have verified_at > 0)
-    state = await refresh_admin_verification(state, content_manager, user_id, username)
+    state = await refresh_admin_verification(state, content_manager, context.bot_data["config"].verification_ttl, user_id, username)
 
     # Check if user has admin access after verification  
     if state.verified_at == 0:
@@ -450,7 +475,6 @@ async def admin_message_handler(update: Update, context: ContextTypes.DEFAULT_TY
         
     else:
         # EDIT EXISTING PROMO
-        await content_manager.refresh_cache(True)
         update_data = build_update_data(edit_mode, components)
         if await content_manager.update_promo(promo_id, **update_data):
             # Success path
@@ -620,6 +644,20 @@ async def detect_edit_mode(update: Update) -> Tuple[str, int]:
 
 # ===== MAIN ADMIN CALLBACK HANDLER =====
 
+# Admin callback action (camelCase) -> handler
+_ADMIN_CALLBACK_ROUTES = {
+    "adminPublish": toggle_promo_status_inline,
+    "adminView": toggle_view_mode_inline,
+    "confirmDelete": confirm_delete_promo,
+    "adminEdit": edit_promo_inline,
+    "adminToggle": toggle_promo_status_inline,
+    "adminDelete": delete_promo_inline,
+    "editText": edit_text_handler,
+    "editImage": edit_image_handler,
+    "editLink": edit_link_handler,
+    "editAll": edit_all_handler,
+}
+
 async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager):
     """Handle admin callback queries"""
     log_update(update, "ADMIN CALLBACK HANDLER")
@@ -633,38 +671,20 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     user_id, username, _ = get_user_info(update)
     data = query.data
     
-    logger.info(f"ADMIN CALLBACK: user_id={user_id}, data={data}")
+    logger.info("ADMIN CALLBACK: user_id=%s, data=%s", user_id, data)
     
     # Decode callback data
     action, state = StateManager.decode_callback_data(data)
     
     # Check admin access (stateless)
-    state = await refresh_admin_verification(state, content_manager, user_id, username)
+    state = await refresh_admin_verification(state, content_manager, context.bot_data["config"].verification_ttl, user_id, username)
     if state.verified_at == 0:
-        await show_status(update, text="🔐 Необходимы права администратора.")
+        await show_status(update, state, text=ADMIN_REQUIRED_TEXT)
         return
     
     # Route to appropriate handler
-    if action == "adminPublish":
-        await toggle_promo_status_inline(update, context, content_manager)
-        logger.info(f"Admin {user_id} published promo {state.promo_id}")
-    elif action == "adminView":
-        await toggle_view_mode_inline(update, context, content_manager)
-    elif action == "confirmDelete":
-        await confirm_delete_promo(update, context, content_manager)
-    elif action == "adminEdit":
-        await edit_promo_inline(update, context, content_manager)
-    elif action == "adminToggle":
-        await toggle_promo_status_inline(update, context, content_manager)
-    elif action == "adminDelete":
-        await delete_promo_inline(update, context, content_manager)
-    elif action == "editText":
-        await edit_text_handler(update, context, content_manager)
-    elif action == "editImage":
-        await edit_image_handler(update, context, content_manager)
-    elif action == "editLink":
-        await edit_link_handler(update, context, content_manager)
-    elif action == "editAll":
-        await edit_all_handler(update, context, content_manager)
-    else:
-        logger.warning(f"Unknown admin callback action: {action}")
\ No newline at end of file
+    handler = _ADMIN_CALLBACK_ROUTES.get(action)
+    if handler is None:
+        logger.warning("Unknown admin callback action: %s", action)
+        return
+    await handler(update, context, content_manager)
\ No newline at end of file
@@ -1,16 +1,18 @@
+import asyncio
 import logging
-import os
+from telegram import Update
 from telegram.ext import Application
 from dotenv import load_dotenv
 
 load_dotenv()  # This loads the .env file
 
 from bot import create_application
+from config import BotConfig
 
 # Enable logging
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", 
-    level=logging.INFO
+    level=BotConfig.log_level()
 )
 logger = logging.getLogger(__name__)
 
@@ -18,21 +20,31 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram.ext._updater").setLevel(logging.WARNING)
 logging.getLogger("telegram.ext._application").setLevel(logging.WARNING)
 
-def validate_environment():
-    """Validate required environment variables"""
+# Use libuv-based event loop for all Telegram I/O when available
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Using uvloop event loop")
+except ImportError:
+    logger.info("uvloop not installed - using default asyncio event loop")
+
+# Only the update types the bot has handlers for - Telegram doesn't send (and we don't parse) the rest
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+def validate_environment(config: BotConfig):
+    """Validate required environment variables (as read into config)"""
     required_vars = {
-        "MAIN_BOT_TOKEN": "Main bot token from @BotFather",
-        "GOOGLE_SPREADSHEET_ID": "Google Sheets spreadsheet ID"
+        "MAIN_BOT_TOKEN": (config.token, "Main bot token from @BotFather"),
+        "GOOGLE_SPREADSHEET_ID": (config.spreadsheet_id, "Google Sheets spreadsheet ID")
     }
     
     missing_vars = []
-    for var, description in required_vars.items():
-        if not os.getenv(var):
+    for var, (value, description) in required_vars.items():
+        if not value:
             missing_vars.append(f"  {var}: {description}")
     
     # Check for webhook URL in production
-    port = os.getenv("PORT")
-    if port and not os.getenv("HEROKU_APP_NAME"):
+    if config.port and not config.app_name:
         missing_vars.append("  HEROKU_APP_NAME: Required for webhook URL in production")
     
     if missing_vars:
@@ -41,49 +53,49 @@ def validate_environment():
         raise RuntimeError(error_msg)
     
     # Optional but recommended
-    if not os.getenv("GOOGLE_SHEETS_CREDENTIALS"):
+    if not config.sheets_credentials:
         logger.warning("GOOGLE_SHEETS_CREDENTIALS not set - Google Sheets integration will not work")
 
 def main():
     """Main application entry point"""
     try:
-        # Validate environment
-        validate_environment()
+        # Read settings once and validate them
+        config = BotConfig.from_env()
+        validate_environment(config)
         
         logger.info("Starting BC Loyalty Bot (Unified)...")
         
         # Create bot application
-        application = create_application()
+        application = create_application(config)
         
         if not application:
             logger.error("Failed to create bot application")
             return
         
         # Determine if we're running locally or on Heroku
-        port = os.getenv("PORT")
-        
-        if port:
+        if config.port:
             # Production mode - run webhook on Heroku
             logger.info("Running in webhook mode (production)")
             
             # Construct webhook URL for Heroku
-            app_name = os.getenv("HEROKU_APP_NAME")
-            webhook_url = f"https://{app_name}.herokuapp.com/"
+            webhook_url = f"https://{config.app_name}.herokuapp.com/"
             
             logger.info(f"Setting webhook URL: {webhook_url}")
             
             # Start webhook - PTB handles the event loop internally
             application.run_webhook(
                 listen="0.0.0.0",
-                port=int(port),
+                port=config.port,
                 webhook_url=webhook_url,
-                allowed_updates=["message", "callback_query"]
+                allowed_updates=ALLOWED_UPDATES
             )
         else:
             # Development mode - run polling
             logger.info("Running in polling mode (development)")
+            # Long polling: each getUpdates waits up to 20s for updates instead of returning empty every 10s
             application.run_polling(
-                allowed_updates=["message", "callback_query"]
+                timeout=20,
+                allowed_updates=ALLOWED_UPDATES
             )
     
     except Exception as e:
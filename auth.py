@@ -1,28 +1,19 @@
 import time
-import os
 import logging
-from typing import Tuple
+from typing import Optional, Tuple
 from telegram import Update
 
 from state_manager import StateManager
 
 logger = logging.getLogger(__name__)
 
-def get_verification_ttl() -> int:
-    """Get verification TTL based on environment"""
-    is_dev = not os.getenv("PORT")  # No PORT means local development
-    if is_dev:
-        return 600  # 10 minutes for dev/testing
-    else:
-        return 86400  # 24 hours for production
-
-def is_verification_expired(verified_at: int) -> bool:
-    """Check if admin verification has expired"""
+def is_verification_expired(verified_at: int, ttl: int, now: Optional[int] = None) -> bool:
+    """Check if admin verification has expired (ttl: BotConfig.verification_ttl, now: current timestamp, if already known)"""
     if verified_at == 0:
         return False
-    current_time = int(time.time())
-    ttl = get_verification_ttl()
-    return (current_time - verified_at) >= ttl
+    if now is None:
+        now = int(time.time())
+    return (now - verified_at) >= ttl
 
 def get_user_info(update: Update) -> Tuple[int, str, str]:
     """Extract user info from update"""
@@ -36,39 +27,34 @@ def get_user_info(update: Update) -> Tuple[int, str, str]:
 async def check_admin_access(content_manager, user_id: int, username: str = "") -> bool:
     """Check if user has admin access (by user_id in admin db)"""
     try:
-        await content_manager.refresh_cache(True)
-        logger.info(f"Full auth_cache dump: {content_manager.auth_cache}")
+        # Cached lookup - auth data is reloaded in the background, on admin changes and by /refresh
         user_id_str = str(user_id)
-        logger.info(f"Checking admin access for user_id: {user_id_str}, username: {username}")
-        logger.debug(f"Auth cache: {content_manager.auth_cache}")
+        logger.debug("Auth cache: %s", content_manager.auth_cache)
         
-        # auth_cache now uses admin_id as key instead of phone_number
-        for admin_id, auth_data in content_manager.auth_cache.items():
-            logger.debug(f"Checking admin_id {admin_id}: {auth_data}")
-            if str(auth_data.get("user_id")) == user_id_str:
-                logger.info(f"Admin access granted for user {user_id_str} (matched by user_id)")
-                return True
-        logger.info(f"Admin access denied for user {user_id_str}")
-        return False
+        # auth_cache is keyed by admin_id, use the user_id reverse index for O(1) lookup
+        auth_data = content_manager.auth_by_user_id.get(user_id_str)
+        logger.info("Admin check user_id=%s (@%s) allowed=%s", user_id_str, username, auth_data is not None)
+        return auth_data is not None
     except Exception as e:
         logger.error(f"Error checking admin access: {e}")
         return False
 
-async def refresh_admin_verification(state, content_manager, user_id: int, username: str = "") -> StateManager:
+async def refresh_admin_verification(state, content_manager, ttl: int, user_id: int, username: str = "") -> StateManager:
     """
-    Refresh admin verification if expired
+    Refresh admin verification if expired (ttl: BotConfig.verification_ttl)
     Returns updated state
     """
     if state.verified_at == 0:
         # Not admin, don't check
         return state
-    if not is_verification_expired(state.verified_at):
+    now = int(time.time())
+    if not is_verification_expired(state.verified_at, ttl, now):
         # Still valid
         return state
     # Verification expired, re-check
     new_verified_at = 0
     if await check_admin_access(content_manager, user_id, username):
-        new_verified_at = int(time.time())
+        new_verified_at = now
     state = StateManager.update_state(state, verified_at = new_verified_at)
     if new_verified_at == 0:
         logger.info(f"Admin access revoked for user {user_id} (@{username}) due to expired verification")
@@ -1,43 +1,94 @@
+import asyncio
+import gc
 import logging
-import os
+import re
+from functools import partial
+from typing import Optional
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler, 
+    AIORateLimiter, Application, CommandHandler, CallbackQueryHandler, 
     MessageHandler, filters, ContextTypes
 )
 from telegram import Update
+from telegram.request import HTTPXRequest
 
+from config import BotConfig
 from content_manager import ContentManager
+from state_manager import StateManager
+from utils import per_chat_concurrent
 from user_handlers import start_command, navigation_handler
 from admin_handlers import (
-    admin_message_handler, admin_callback_handler, back_to_promo_handler, login_command, logout_command
+    admin_message_handler, admin_callback_handler, back_to_promo_handler, login_command, logout_command, refresh_command
 )
 
 # Enable logging
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", 
-    level=logging.INFO
+    level=BotConfig.log_level()
 )
 logger = logging.getLogger(__name__)
 
-def create_application():
+# Callback data patterns, compiled once for the dispatcher
+NAV_PATTERN = re.compile(r"^(?:prev|next)")
+ADMIN_PATTERN = re.compile(r"^(?:(?:admin|confirm|edit)[A-Z]|backToPromo)")
+STATE_PATTERN = re.compile(r"^state_")
+
+# Admin content messages: plain text (not commands) or photos
+ADMIN_MSG_FILTER = (filters.TEXT & ~filters.COMMAND) | filters.PHOTO
+
+# Stateless callback routing
+ADMIN_ACTION_PREFIXES = ("admin", "confirm", "edit")
+_STATELESS_ROUTES = {
+    "prev": navigation_handler,
+    "next": navigation_handler,
+    "backToPromo": back_to_promo_handler,
+}
+
+def create_application(config: Optional[BotConfig] = None):
     """Create and configure the bot application"""
     try:
-        # Get token
-        dev_token = os.getenv("DEV_BOT_TOKEN")
-        if dev_token:
-            token = dev_token
+        if config is None:
+            config = BotConfig.from_env()
+        if config.is_dev:
             logger.info("Using DEV_BOT_TOKEN for development environment")
-        else:
-            token = os.getenv("MAIN_BOT_TOKEN")
 
         # Initialize content manager
         content_manager = ContentManager(
-            os.getenv("GOOGLE_SHEETS_CREDENTIALS", ""), 
-            os.getenv("GOOGLE_SPREADSHEET_ID")
+            config.sheets_credentials, 
+            config.spreadsheet_id,
+            is_dev=config.is_dev,
+            snapshot_file=config.cache_snapshot_file
         )
         
         # Create application
-        application = Application.builder().token(token).build()
+        # One pooled HTTP/2 client is shared by every outgoing Bot API call
+        # Short pool/connect timeouts make handlers fail fast instead of piling up
+        request = HTTPXRequest(
+            connection_pool_size=256,
+            pool_timeout=5.0,
+            connect_timeout=5.0,
+            read_timeout=20.0,
+            http_version="2"
+        )
+        # getUpdates (polling mode) gets its own single connection so it never competes with handlers
+        get_updates_request = HTTPXRequest(connection_pool_size=1)
+        # Throttle outgoing calls below Telegram's 30 msg/s flood limit and retry once on RetryAfter
+        rate_limiter = AIORateLimiter(overall_max_rate=28, overall_time_period=1, max_retries=1)
+        # Process up to 256 updates concurrently instead of one at a time (bounds running handlers and their memory)
+        application = (
+            Application.builder()
+            .token(config.token)
+            .request(request)
+            .get_updates_request(get_updates_request)
+            .rate_limiter(rate_limiter)
+            .concurrent_updates(256)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
+        
+        # Shared with the lifecycle hooks (post_init/post_shutdown) and handlers (config)
+        application.bot_data["content_manager"] = content_manager
+        application.bot_data["config"] = config
         
         # Register handlers
         register_all_handlers(application, content_manager)
@@ -49,131 +100,153 @@ def create_application():
         return application
         
     except Exception as e:
-        logger.error(f"Failed to create application: {e}")
+        logger.error("Failed to create application: %s", e)
         return None
 
+async def post_init(application: Application):
+    """
+    Load caches before the first update and keep them fresh in the background,
+    then freeze startup objects so the GC stops rescanning them on every collection
+    """
+    content_manager = application.bot_data["content_manager"]
+    await content_manager.refresh_cache()
+    application.bot_data["refresh_task"] = asyncio.create_task(content_manager.run_refresh_loop())
+
+    gc.collect()
+    gc.freeze()
+    logger.info("GC frozen after startup: %s objects", gc.get_freeze_count())
+
+async def post_shutdown(application: Application):
+    """Stop the background cache refresh"""
+    refresh_task = application.bot_data.pop("refresh_task", None)
+    if refresh_task:
+        refresh_task.cancel()
+        # Wait for the cancellation to land (e.g. after an in-flight Sheets call) before the loop closes
+        await asyncio.gather(refresh_task, return_exceptions=True)
+
 def register_all_handlers(application: Application, content_manager: ContentManager):
-    """Register all command and callback handlers"""
-    
-    # ===== COMMON COMMANDS =====
-    
-    # Start command (available to all users)
-    application.add_handler(
-        CommandHandler("start", lambda update, context: start_command(update, context, content_manager))
-    )
+    """
+    Register all command and callback handlers
+    Different chats are served concurrently, up to the builder's concurrent_updates(256) limit
+    (handlers stay blocking so that limit counts running handlers);
+    per_chat_concurrent keeps updates from the same chat in order
+    PTB stops at the first matching handler, so the most frequent updates are registered first
+    (all filters/patterns are mutually exclusive, so the order does not change routing)
+    """
     
     # ===== USER NAVIGATION CALLBACKS =====
     
     # Navigation buttons (prev/next) - stateless with embedded state
     application.add_handler(
         CallbackQueryHandler(
-            lambda update, context: navigation_handler(update, context, content_manager),
-            pattern="^(prev|next)"
+            per_chat_concurrent(partial(navigation_handler, content_manager=content_manager)),
+            pattern=NAV_PATTERN
         )
     )
     
-    # ===== ADMIN COMMANDS =====
-    
-    # Login command for admin access
-    application.add_handler(
-        CommandHandler("login", lambda update, context: login_command(update, context, content_manager))
-    )
-    
-    # Logout command for admins
+    # State-encoded callbacks (state_* pattern for JSON-encoded stateless data)
     application.add_handler(
-        CommandHandler("logout", lambda update, context: logout_command(update, context, content_manager))
+        CallbackQueryHandler(
+            per_chat_concurrent(partial(handle_stateless_callback, content_manager=content_manager)),
+            pattern=STATE_PATTERN
+        )
     )
     
     # ===== ADMIN CALLBACK HANDLERS =====
     
-    # Back to promo button (admin only, camelCase)
+    # Admin callback handlers (admin*, confirm*, edit* and backToPromo camelCase actions)
     application.add_handler(
         CallbackQueryHandler(
-            lambda update, context: back_to_promo_handler(update, context, content_manager),
-            pattern="^backToPromo"
+            per_chat_concurrent(partial(handle_admin_callback, content_manager=content_manager)),
+            pattern=ADMIN_PATTERN
         )
     )
-
-    # Admin callback handlers (all admin* camelCase actions)
+    
+    # ===== MESSAGE HANDLERS =====
+    
+    # Admin message handler for creating/editing promos
+    # Catches all non-command text and photo messages
     application.add_handler(
-        CallbackQueryHandler(
-            lambda update, context: admin_callback_handler(update, context, content_manager),
-            pattern="^admin[A-Z]"
+        MessageHandler(
+            ADMIN_MSG_FILTER,
+            per_chat_concurrent(partial(admin_message_handler, content_manager=content_manager))
         )
     )
-
-    # Confirmation callbacks (confirm* camelCase)
+    
+    # ===== ADMIN COMMANDS =====
+    
+    # Login command for admin access
     application.add_handler(
-        CallbackQueryHandler(
-            lambda update, context: admin_callback_handler(update, context, content_manager),
-            pattern="^confirm[A-Z]"
-        )
+        CommandHandler("login", per_chat_concurrent(partial(login_command, content_manager=content_manager)))
     )
-
-    # Edit dialog callbacks (edit* camelCase)
+    
+    # Logout command for admins
     application.add_handler(
-        CallbackQueryHandler(
-            lambda update, context: admin_callback_handler(update, context, content_manager),
-            pattern="^edit[A-Z]"
-        )
+        CommandHandler("logout", per_chat_concurrent(partial(logout_command, content_manager=content_manager)))
     )
     
-    # State-encoded callbacks (state_* pattern for JSON-encoded stateless data)
+    # Refresh command - reload data from Google Sheets after direct edits
     application.add_handler(
-        CallbackQueryHandler(
-            lambda update, context: handle_stateless_callback(update, context, content_manager),
-            pattern="^state_"
-        )
+        CommandHandler("refresh", per_chat_concurrent(partial(refresh_command, content_manager=content_manager)))
     )
     
-    # ===== MESSAGE HANDLERS =====
+    # ===== COMMON COMMANDS =====
     
-    # Admin message handler for creating/editing promos
-    # This should be last to catch all text/photo messages from admins
+    # Start command (available to all users)
     application.add_handler(
-        MessageHandler(
-            filters.TEXT | filters.PHOTO,
-            lambda update, context: admin_message_handler(update, context, content_manager)
-        )
+        CommandHandler("start", per_chat_concurrent(partial(start_command, content_manager=content_manager)))
     )
     
     logger.info("All handlers registered successfully (stateless mode)")
 
+async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager):
+    """Route admin surface callbacks: back to promo, or any admin*/confirm*/edit* action"""
+    if update.callback_query.data.startswith("backToPromo"):
+        await back_to_promo_handler(update, context, content_manager)
+    else:
+        await admin_callback_handler(update, context, content_manager)
+
 async def handle_stateless_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager):
     """Handle stateless callbacks with JSON-encoded state"""
-    # Import here to avoid circular imports
-    from state_manager import StateManager
-    
     query = update.callback_query
     await query.answer()
     
     # Decode the action and route to appropriate handler
     action, state = StateManager.decode_callback_data(query.data)
     
-    logger.info(f"STATELESS CALLBACK: action={action}, state={state}")
+    logger.info("STATELESS CALLBACK: action=%s, state=%s", action, state)
     
-    # Route based on action (camelCase)
-    if action.startswith("admin") or action.startswith("confirm") or action.startswith("edit"):
-        await admin_callback_handler(update, context, content_manager)
-    elif action in ["prev", "next"]:
-        await navigation_handler(update, context, content_manager)
-    elif action == "backToPromo":
-        await back_to_promo_handler(update, context, content_manager)
+    # Route based on action (camelCase): exact actions first, then admin* / confirm* / edit* prefixes
+    handler = _STATELESS_ROUTES.get(action)
+    if handler is None and action.startswith(ADMIN_ACTION_PREFIXES):
+        handler = admin_callback_handler
+    if handler:
+        await handler(update, context, content_manager)
     else:
-        logger.warning(f"Unknown stateless callback action: {action}")
+        logger.warning("Unknown stateless callback action: %s", action)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Global error handler"""
-    logger.error(f"Bot error: {context.error}")
+    logger.error("Bot error: %s", context.error)
     
-    if update:
-        logger.error(f"Update that caused error: {update}")
-        
-        # Try to send error message to user
-        try:
-            if update.effective_message:
-                await update.effective_message.reply_text(
-                    "❌ Возникла ошибка при обработке вашего запроса.\n\nПожалуйста, попробуйте еще раз: /start"
-                )
-        except Exception as e:
-            logger.error(f"Failed to send error message to user: {e}")
\ No newline at end of file
+    if not isinstance(update, Update):
+        return
+    
+    # Identify the update by id and chat only - dumping the whole Update is slow for photo messages
+    chat = update.effective_chat
+    logger.error("Update that caused error: update_id=%s chat_id=%s", update.update_id, chat.id if chat else None)
+    
+    message = update.effective_message
+    if not message:
+        return  # Nothing to reply to (e.g. callback on an inaccessible message)
+    
+    # Try to send error message to user - bounded so error replies don't pile up during outages
+    try:
+        await asyncio.wait_for(
+            message.reply_text(
+                "❌ Возникла ошибка при обработке вашего запроса.\n\nПожалуйста, попробуйте еще раз: /start"
+            ),
+            timeout=2.0
+        )
+    except Exception as e:
+        logger.error("Failed to send error message to user: %s", e)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import logging
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True, slots=True)
+class BotConfig:
+    """Bot settings read once from the environment at startup"""
+
+    token: str                     # DEV_BOT_TOKEN if set, otherwise MAIN_BOT_TOKEN
+    is_dev: bool                   # True when running with DEV_BOT_TOKEN
+    sheets_credentials: str        # Google service account JSON
+    spreadsheet_id: Optional[str]  # Google Spreadsheet ID
+    port: Optional[int]            # Webhook port (production), None = polling
+    app_name: Optional[str]        # Heroku app name for the webhook URL
+    verification_ttl: int          # Admin verification lifetime in seconds
+    default_image_file_id: Optional[str]  # Fallback image for promos without their own picture
+    cache_snapshot_file: Optional[str]  # Local promos snapshot path, None = off (opt-in, needs a persistent disk)
+
+    @classmethod
+    def from_env(cls) -> "BotConfig":
+        """Build config from environment variables"""
+        dev_token = os.getenv("DEV_BOT_TOKEN")
+        port = os.getenv("PORT")
+        snapshot_file = os.getenv("CACHE_SNAPSHOT_FILE")
+        return cls(
+            token=dev_token or os.getenv("MAIN_BOT_TOKEN"),
+            is_dev=bool(dev_token),
+            sheets_credentials=os.getenv("GOOGLE_SHEETS_CREDENTIALS", ""),
+            spreadsheet_id=os.getenv("GOOGLE_SPREADSHEET_ID"),
+            port=int(port) if port else None,
+            app_name=os.getenv("HEROKU_APP_NAME"),
+            # No PORT means local development: 10 minutes for dev/testing, 24 hours for production
+            verification_ttl=86400 if port else 600,
+            default_image_file_id=os.getenv("DEFAULT_IMAGE_FILE_ID"),
+            cache_snapshot_file=os.path.expanduser(snapshot_file) if snapshot_file else None
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def log_level() -> int:
+        """
+        LOG_LEVEL for logging.basicConfig (read on its own: logging is set up at import, before from_env)
+        Unknown names fall back to INFO instead of failing startup
+        """
+        name = (os.getenv("LOG_LEVEL") or "INFO").strip().upper()
+        level = logging.getLevelName(name)
+        if not isinstance(level, int):
+            logger.warning("Invalid LOG_LEVEL %r, using INFO", name)
+            return logging.INFO
+        return level
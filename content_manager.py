@@ -1,24 +1,41 @@
+import asyncio
 import os
 import logging
 import json
+import tempfile
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import gspread
 from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
 class ContentManager:
     """Manages promo content via Google Sheets"""
     
-    def __init__(self, credentials_json: str, spreadsheet_id: str):
+    def __init__(self, credentials_json: str, spreadsheet_id: str, is_dev: bool = False, snapshot_file: Optional[str] = None):
         self.spreadsheet_id = spreadsheet_id
+        # Local snapshot of the promos cache, so a restarted bot can serve users before its first Sheets read
+        # Admin data is never written to it; None disables the snapshot
+        self.snapshot_file = snapshot_file
         self.client = None
         self.sheet = None
         self.promos_cache = []
+        self.promos_by_id = {}
+        self.active_promos = []  # Active promos in display order, rebuilt on every refresh
+        self._row_index = {}  # promo_id -> sheet row number, rebuilt on every refresh
+        self.total_count = 0   # Number of promos in cache
+        self.active_count = 0  # Number of active promos in cache
+        self.summary_cache = {}  # Formatted admin summaries keyed by max_count
         self.auth_cache = {}
-        self.last_update = 0
-        self.cache_timeout = 600  # 10 minutes
+        self.auth_by_user_id = {}  # Reverse index: str(user_id) -> auth data
+        self.last_update = 0       # Last promos refresh
+        self.last_auth_update = 0  # Last auth refresh
+        self._ws_cache = {}  # Worksheet handles by name, fetched once
+        self._refresh_lock = asyncio.Lock()  # Single-flight guard: concurrent callers share one Sheets read
+        self.cache_timeout = 600  # 10 minutes - promos change with every admin action
+        self.auth_cache_timeout = 3600  # 1 hour - admins rarely change (writes and /refresh force a reload)
 
         # Initialize Google Sheets client
         try:
@@ -30,9 +47,11 @@ class ContentManager:
                 ]
                 creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
                 self.client = gspread.authorize(creds)
+                # Keep a larger pool of kept-alive connections: Sheets calls run concurrently in worker threads
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+                self.client.session.mount("https://", adapter)
                 self.sheet = self.client.open_by_key(spreadsheet_id)
                 logger.info("Google Sheets client initialized successfully")
-                is_dev = bool(os.getenv("DEV_BOT_TOKEN"))
                 self.promo_sheet_name = "promo_messages_dev" if is_dev else "promo_messages"
             else:
                 logger.warning("No Google Sheets credentials provided")
@@ -41,64 +60,202 @@ class ContentManager:
             self.client = None
             self.sheet = None
 
+        if self.sheet and self.snapshot_file:
+            self._load_snapshot()
+
+    def _set_promos(self, promos_cache: List[Dict], row_index: Dict[int, int]):
+        """Install a new promos list and rebuild everything derived from it"""
+        self.promos_cache = promos_cache
+        self.promos_by_id = {p["id"]: p for p in promos_cache}
+        self._row_index = row_index
+        self.total_count = len(promos_cache)
+        self.active_promos = [p for p in promos_cache if p["status"] == "active"]
+        self.active_count = len(self.active_promos)
+        self.summary_cache = {}
+
+    def _set_auth(self, auth_cache: Dict):
+        """Install a new admin list and rebuild the user_id index"""
+        self.auth_cache = auth_cache
+        self.auth_by_user_id = {
+            str(auth_data["user_id"]): auth_data
+            for auth_data in auth_cache.values()
+            if auth_data["user_id"] != ""
+        }
+
+    def _load_snapshot(self):
+        """Load promos saved by a previous run; the usual TTL then decides when to refresh (auth loads on first refresh)"""
+        try:
+            with open(self.snapshot_file, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot.get("source") != [self.spreadsheet_id, self.promo_sheet_name]:
+                return  # Snapshot of another spreadsheet or environment
+            self._set_promos(snapshot["promos"], {int(k): v for k, v in snapshot["row_index"].items()})
+            self.last_update = snapshot["last_update"]
+            logger.info(f"Loaded cache snapshot: {self.total_count} promos")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache snapshot: {e}")
+
+    def _save_snapshot(self):
+        """
+        Write the promos cache to the snapshot file
+        Atomic (a crash never leaves half a file) and owner-only: the file and its directory are 0600/0700
+        """
+        snapshot = {
+            "source": [self.spreadsheet_id, self.promo_sheet_name],
+            "promos": self.promos_cache,
+            "row_index": self._row_index,
+            "last_update": self.last_update
+        }
+        tmp_path = None
+        try:
+            snapshot_dir = os.path.dirname(self.snapshot_file) or "."
+            os.makedirs(snapshot_dir, mode=0o700, exist_ok=True)
+            # mkstemp creates a unique 0600 file, so nobody else can read or pre-plant it
+            fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_file)
+        except Exception as e:
+            logger.warning(f"Failed to save cache snapshot: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _ws(self, name: str):
+        """Get a worksheet handle, fetching its metadata from Google Sheets only on first use"""
+        worksheet = self._ws_cache.get(name)
+        if worksheet is None:
+            worksheet = await asyncio.to_thread(self.sheet.worksheet, name)
+            self._ws_cache[name] = worksheet
+        return worksheet
+
     async def refresh_cache(self, force: bool = False):
-        """Refresh content cache from Google Sheets"""
+        """
+        Refresh content cache from Google Sheets
+        gspread is blocking, so every Sheets call runs in a worker thread (asyncio.to_thread)
+        to keep the event loop serving other chats meanwhile
+        """
         if not self.client or not self.sheet:
             logger.warning("Google Sheets client not available")
             return False
             
-        now = datetime.now().timestamp()
-        if not force and (now - self.last_update) < self.cache_timeout:
+        requested_at = datetime.now().timestamp()
+        if not force and not any(self._stale_parts(requested_at)):
             return True
-            
+
+        async with self._refresh_lock:
+            # Another caller may have refreshed while we waited for the lock
+            now = datetime.now().timestamp()
+            if force:
+                if min(self.last_update, self.last_auth_update) >= requested_at:
+                    return True  # That refresh started after our request, so it already has the latest data
+                return await self._do_refresh(now, promos=True, auth=True)
+            promos_stale, auth_stale = self._stale_parts(now)
+            if not promos_stale and not auth_stale:
+                return True
+            return await self._do_refresh(now, promos=promos_stale, auth=auth_stale)
+
+    async def run_refresh_loop(self, interval: int = 60):
+        """
+        Keep caches warm in the background so handlers never wait on Google Sheets
+        Each pass only reloads the parts whose TTL has expired
+        """
+        while True:
+            try:
+                await self.refresh_cache()
+            except Exception as e:
+                logger.error(f"Background cache refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+    def _stale_parts(self, now: float) -> Tuple[bool, bool]:
+        """Return (promos_stale, auth_stale) - each cache has its own TTL"""
+        promos_stale = (now - self.last_update) >= self.cache_timeout
+        auth_stale = (now - self.last_auth_update) >= self.auth_cache_timeout
+        return promos_stale, auth_stale
+
+    async def _do_refresh(self, now: float, promos: bool = True, auth: bool = True) -> bool:
+        """Reload promos and/or auth data from Google Sheets (caller holds _refresh_lock)"""
         promos_error = None
         auth_error = None
 
-        # Refresh promos cache
+        # Import here to avoid circular imports
+        from utils import escape_unmatched_markdown
+
+        # Fetch the stale sheets in one request as raw values - no per-row header zipping like get_all_records
+        ranges = []
+        if promos:
+            ranges.append(f"'{self.promo_sheet_name}'!A2:H")
+        if auth:
+            ranges.append("'authorized_users'!A2:C")
+        promos_rows, auth_rows = None, None
         try:
-            promos_sheet = self.sheet.worksheet(self.promo_sheet_name)
-            promos_data = promos_sheet.get_all_records()
-            self.promos_cache = []
-            if promos_data:
-                for row in promos_data:
-                    if row.get("id"):
-                        self.promos_cache.append({
-                            "id": int(row["id"]),
-                            "text": row.get("text", ""),
-                            "image_file_id": row.get("image_file_id", ""),
-                            "link": row.get("link", ""),
-                            "order": int(row.get("order", 0)),
-                            "status": row.get("status", "draft"),
-                            "created_by": row.get("created_by", ""),
-                            "created_at": row.get("created_at", "")
-                        })
-                self.promos_cache.sort(key=lambda x: x["order"])
+            response = await asyncio.to_thread(self.sheet.values_batch_get, ranges)
+            value_ranges = [value_range.get("values", []) for value_range in response.get("valueRanges", [])]
+            if promos:
+                promos_rows = value_ranges.pop(0)
+            if auth:
+                auth_rows = value_ranges.pop(0)
         except Exception as e:
-            promos_error = str(e)
-            logger.error(f"Failed to refresh promos cache: {e}")
+            promos_error = auth_error = str(e)
+            logger.error(f"Failed to fetch sheets data: {e}")
 
-        # Refresh auth cache - now using admin_id instead of phone_number
-        try:
-            auth_sheet = self.sheet.worksheet("authorized_users")
-            auth_data = auth_sheet.get_all_records()
-            self.auth_cache = {}
-            if auth_data:
-                for row in auth_data:
-                    admin_id = row.get("admin_id")
-                    if admin_id is not None and admin_id != "":
-                        self.auth_cache[admin_id] = {
-                            "user_id": row.get("user_id", ""),
-                            "added_at": row.get("added_at", "")
+        # Refresh promos cache
+        # Columns: A id, B text, C image_file_id, D link, E order, F status, G created_by, H created_at
+        if promos_rows is not None:
+            try:
+                promos_cache = []
+                row_index = {}
+                for row_number, row in enumerate(promos_rows, start=2):  # Row 1 is the header
+                    row = row + [""] * (8 - len(row))  # Sheets API drops trailing empty cells
+                    promo_id, text, image_file_id, link, order, status, created_by, created_at = row[:8]
+                    if promo_id:
+                        row_index[int(promo_id)] = row_number
+                        promos_cache.append({
+                            "id": int(promo_id),
+                            "text": text,
+                            "text_markdown": escape_unmatched_markdown(str(text)),
+                            "image_file_id": image_file_id,
+                            "link": link,
+                            "order": int(order or 0),
+                            "status": status or "draft",
+                            "created_by": created_by,
+                            "created_at": created_at
+                        })
+                promos_cache.sort(key=lambda x: x["order"])
+                self._set_promos(promos_cache, row_index)
+                self.last_update = now  # Only a successful load counts as fresh
+            except Exception as e:
+                promos_error = str(e)
+                logger.error(f"Failed to refresh promos cache: {e}")
+
+        # Refresh auth cache - keyed by admin_id
+        # Columns: A admin_id, B user_id, C added_at
+        if auth_rows is not None:
+            try:
+                auth_cache = {}
+                for row in auth_rows:
+                    row = row + [""] * (3 - len(row))
+                    admin_id, user_id, added_at = row[:3]
+                    if admin_id != "":
+                        auth_cache[admin_id] = {
+                            "user_id": user_id,
+                            "added_at": added_at
                         }
-        except Exception as e:
-            auth_error = str(e)
-            logger.error(f"Failed to refresh auth cache: {e}")
+                self._set_auth(auth_cache)
+                self.last_auth_update = now
+            except Exception as e:
+                auth_error = str(e)
+                logger.error(f"Failed to refresh auth cache: {e}")
 
-        self.last_update = now
-        logger.info(f"Cache refreshed: {len(self.promos_cache)} promos, {len(self.auth_cache)} auth users")
+        logger.info(f"Cache refreshed (promos={promos}, auth={auth}): {len(self.promos_cache)} promos, {len(self.auth_cache)} auth users")
         if promos_error or auth_error:
+            # Failed parts keep their old timestamps, so they stay stale and the next call or loop tick retries them
             logger.error(f"Cache refresh errors - promos: {promos_error}, auth: {auth_error}")
             return False
+        if self.snapshot_file and promos:
+            # Only promos are snapshotted - an auth-only refresh leaves the file as it is
+            await asyncio.to_thread(self._save_snapshot)
         return True
 
     async def get_onboarding_password(self) -> Optional[str]:
@@ -108,8 +265,8 @@ class ContentManager:
             return None
             
         try:
-            auth_sheet = self.sheet.worksheet("authorized_users")
-            password_cell = auth_sheet.acell("H1").value
+            auth_sheet = await self._ws("authorized_users")
+            password_cell = (await asyncio.to_thread(auth_sheet.acell, "H1")).value
             return password_cell.strip() if password_cell else None
         except Exception as e:
             logger.error(f"Failed to get onboarding password: {e}")
@@ -122,10 +279,10 @@ class ContentManager:
             return False
             
         try:
-            auth_sheet = self.sheet.worksheet("authorized_users")
+            auth_sheet = await self._ws("authorized_users")
             
             # Get existing data to find next admin_id
-            existing_data = auth_sheet.get_all_records()
+            existing_data = await asyncio.to_thread(auth_sheet.get_all_records)
             next_admin_id = max([int(row.get("admin_id", 0)) for row in existing_data if row.get("admin_id")], default=0) + 1
             
             # Check if user already exists
@@ -140,7 +297,7 @@ class ContentManager:
                 user_id,
                 datetime.now().isoformat()
             ]
-            auth_sheet.append_row(new_row)
+            await asyncio.to_thread(auth_sheet.append_row, new_row)
             
             # Refresh cache to include new user
             await self.refresh_cache(force=True)
@@ -159,14 +316,14 @@ class ContentManager:
             return False
             
         try:
-            auth_sheet = self.sheet.worksheet("authorized_users")
-            records = auth_sheet.get_all_records()
+            auth_sheet = await self._ws("authorized_users")
+            records = await asyncio.to_thread(auth_sheet.get_all_records)
             
             user_id_str = str(user_id)
             
             for i, row in enumerate(records, start=2):  # Start from row 2 (skip header)
                 if str(row.get("user_id")) == user_id_str:
-                    auth_sheet.delete_rows(i)
+                    await asyncio.to_thread(auth_sheet.delete_rows, i)
                     await self.refresh_cache(force=True)
                     logger.info(f"Removed admin user: user_id={user_id}")
                     return True
@@ -179,36 +336,60 @@ class ContentManager:
             return False
 
     def get_active_promos(self) -> List[Dict]:
-        """Get all active promo messages"""
-        return [p for p in self.promos_cache if p["status"] == "active"]
+        """Get all active promo messages (filtered once per cache refresh - do not modify)"""
+        return self.active_promos
     
     def get_all_promos(self) -> List[Dict]:
-        """Get all promo messages"""
-        return self.promos_cache.copy()
+        """Get all promo messages (cached list, replaced on refresh - do not modify)"""
+        return self.promos_cache
+
+    def get_promo_by_id(self, promo_id: int) -> Optional[Dict]:
+        """Get promo message by ID (O(1) lookup in cache index)"""
+        return self.promos_by_id.get(promo_id)
     
+    async def _find_promo_row(self, promos_sheet, promo_id: int) -> int:
+        """
+        Find the sheet row of a promo
+        Uses the cached row index and verifies it with a single-cell read of the id column;
+        falls back to scanning the whole sheet if the row has moved (e.g. after direct edits)
+        Returns 0 if the promo is not in the sheet
+        """
+        row = self._row_index.get(promo_id)
+        if row:
+            cell_value = (await asyncio.to_thread(promos_sheet.acell, f"A{row}")).value
+            if str(cell_value).strip() == str(promo_id):
+                return row
+            logger.info(f"Row index for promo {promo_id} is stale, scanning sheet")
+
+        records = await asyncio.to_thread(promos_sheet.get_all_records)
+        for i, record in enumerate(records, start=2):  # Start from row 2 (skip header)
+            if str(record.get("id")) == str(promo_id):
+                return i
+        return 0
+
     async def add_promo(self, text: str, image_file_id: str, link: str, created_by: str, order: Optional[int] = None) -> int:
-        """Add new promo message"""
+        """Add new promo message (as draft)"""
         if not self.client or not self.sheet:
             logger.error("Google Sheets client not available")
             return 0
             
         try:
-            promos_sheet = self.sheet.worksheet(self.promo_sheet_name)
+            promos_sheet = await self._ws(self.promo_sheet_name)
 
-            # Get next ID
-            existing_data = promos_sheet.get_all_records()
-            next_id = max([int(row.get("id", 0)) for row in existing_data], default=0) + 1
+            # Get next ID and order - read only the id (A) and order (E) columns, not the whole sheet
+            id_column, order_column = await asyncio.to_thread(promos_sheet.batch_get, ["A2:A", "E2:E"])
+            next_id = max([int(row[0]) for row in id_column if row and str(row[0]).strip()], default=0) + 1
             
             # Get next order if not specified
             if order is None:
-                order = max([int(row.get("order", 0)) for row in existing_data], default=0) + 10
+                order = max([int(row[0]) for row in order_column if row and str(row[0]).strip()], default=0) + 10
             
             # Add new row
             new_row = [
                 next_id, text, image_file_id, link, order, 
                 "draft", created_by, datetime.now().isoformat()
             ]
-            promos_sheet.append_row(new_row)
+            await asyncio.to_thread(promos_sheet.append_row, new_row)
             
             # Refresh cache
             await self.refresh_cache(force=True)
@@ -227,15 +408,14 @@ class ContentManager:
             return False
             
         try:
-            promos_sheet = self.sheet.worksheet(self.promo_sheet_name)
-            records = promos_sheet.get_all_records()
+            promos_sheet = await self._ws(self.promo_sheet_name)
+            i = await self._find_promo_row(promos_sheet, promo_id)
             
-            for i, row in enumerate(records, start=2):  # Start from row 2 (skip header)
-                if int(row.get("id", 0)) == promo_id:
-                    promos_sheet.update(f"F{i}", status)  # Column F is status
-                    await self.refresh_cache(force=True)
-                    logger.info(f"Updated promo {promo_id} status to {status}")
-                    return True
+            if i:
+                await asyncio.to_thread(promos_sheet.update, f"F{i}", status)  # Column F is status
+                await self.refresh_cache(force=True)
+                logger.info(f"Updated promo {promo_id} status to {status}")
+                return True
             
             logger.warning(f"Promo {promo_id} not found for status update")
             return False
@@ -251,33 +431,32 @@ class ContentManager:
             return False
             
         try:
-            promos_sheet = self.sheet.worksheet(self.promo_sheet_name)
-            records = promos_sheet.get_all_records()
-            
-            for i, row in enumerate(records, start=2):  # Start from row 2 (skip header)
-                if int(row.get("id", 0)) == promo_id:
-                    # Update specific fields
-                    updates = []
-                    
-                    if "text" in kwargs:
-                        updates.append((f"B{i}", kwargs["text"]))  # Column B is text
-                    if "image_file_id" in kwargs:
-                        updates.append((f"C{i}", kwargs["image_file_id"]))  # Column C is image_file_id
-                    if "link" in kwargs:
-                        updates.append((f"D{i}", kwargs["link"]))  # Column D is link
-                    if "order" in kwargs:
-                        updates.append((f"E{i}", kwargs["order"]))  # Column E is order
-                    if "status" in kwargs:
-                        updates.append((f"F{i}", kwargs["status"]))  # Column F is status
+            promos_sheet = await self._ws(self.promo_sheet_name)
+            i = await self._find_promo_row(promos_sheet, promo_id)
+            
+            if i:
+                # Update specific fields
+                updates = []
+                
+                if "text" in kwargs:
+                    updates.append((f"B{i}", kwargs["text"]))  # Column B is text
+                if "image_file_id" in kwargs:
+                    updates.append((f"C{i}", kwargs["image_file_id"]))  # Column C is image_file_id
+                if "link" in kwargs:
+                    updates.append((f"D{i}", kwargs["link"]))  # Column D is link
+                if "order" in kwargs:
+                    updates.append((f"E{i}", kwargs["order"]))  # Column E is order
+                if "status" in kwargs:
+                    updates.append((f"F{i}", kwargs["status"]))  # Column F is status
+                
+                # Batch update - all changed cells in a single request
+                if updates:
+                    data = [{"range": cell, "values": [[value]]} for cell, value in updates]
+                    await asyncio.to_thread(promos_sheet.batch_update, data)
                     
-                    # Batch update
-                    if updates:
-                        for cell, value in updates:
-                            promos_sheet.update(cell, value)
-                        
-                        await self.refresh_cache(force=True)
-                        logger.info(f"Updated promo {promo_id} fields: {list(kwargs.keys())}")
-                        return True
+                    await self.refresh_cache(force=True)
+                    logger.info(f"Updated promo {promo_id} fields: {list(kwargs.keys())}")
+                    return True
             
             logger.warning(f"Promo {promo_id} not found for update")
             return False
@@ -293,15 +472,14 @@ class ContentManager:
             return False
             
         try:
-            promos_sheet = self.sheet.worksheet(self.promo_sheet_name)
-            records = promos_sheet.get_all_records()
-            
-            for i, row in enumerate(records, start=2):  # Start from row 2 (skip header)
-                if int(row.get("id", 0)) == promo_id:
-                    promos_sheet.delete_rows(i)
-                    await self.refresh_cache(force=True)
-                    logger.info(f"Deleted promo {promo_id}")
-                    return True
+            promos_sheet = await self._ws(self.promo_sheet_name)
+            i = await self._find_promo_row(promos_sheet, promo_id)
+            
+            if i:
+                await asyncio.to_thread(promos_sheet.delete_rows, i)
+                await self.refresh_cache(force=True)
+                logger.info(f"Deleted promo {promo_id}")
+                return True
             
             logger.warning(f"Promo {promo_id} not found for deletion")
             return False
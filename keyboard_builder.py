@@ -80,7 +80,7 @@ class KeyboardBuilder:
             else:
                 toggle_view_text = "👁️ Активные"  # Currently showing active only
 
-            current_promo = next((p for p in target_promos if p["id"] == state.promo_id), None)
+            current_promo = content_manager.get_promo_by_id(state.promo_id) if content_manager else None
             if current_promo and current_promo.get("status") == "active":
                 toggle_status_text = "🔴 Выкл."
             else:
@@ -3,12 +3,27 @@ import logging
 import time
 from typing import Tuple
 from dataclasses import dataclass
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Fast JSON for callback data when available (orjson is optional, stdlib json is the fallback)
+try:
+    import orjson
+
+    def _json_dumps(data) -> str:
+        return orjson.dumps(data).decode()
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(data) -> str:
+        return json.dumps(data, separators=(',', ':'))
+
+    _json_loads = json.loads
+
+@dataclass(frozen=True, slots=True)
 class BotState:
-    """Centralized bot state for stateless operation"""
+    """Centralized bot state for stateless operation (immutable - use StateManager.update_state)"""
     
     promo_id: int = 0              # Current promo DB ID
     verified_at: int = 0           # 0 = not admin, timestamp = admin verified
@@ -96,10 +111,12 @@ class StateManager:
         return callback_data
     
     @staticmethod
+    @lru_cache(maxsize=1024)
     def decode_callback_data(callback_data: str) -> Tuple[str, BotState]:
         """
         Decode callback data back into action and state.
         Returns: (action, BotState) with validated state. If invalid, returns default BotState and logs warning.
+        Results are cached per callback string - BotState is immutable, so cached states are safe to share.
         """
         if callback_data.startswith("state_"):
             action, state = StateManager._decode_json_compressed(callback_data)
@@ -114,7 +131,7 @@ class StateManager:
             return callback_data, BotState()
 
         action = parts[0]
-        state = BotState()
+        fields = {}
 
         # Parse key-value pairs
         i = 1
@@ -124,20 +141,21 @@ class StateManager:
                 value = parts[i + 1]
                 try:
                     if key == "p":
-                        state.promo_id = StateManager._decode_number(value)
+                        fields["promo_id"] = StateManager._decode_number(value)
                     elif key == "v":
-                        state.verified_at = StateManager._decode_number(value)
+                        fields["verified_at"] = StateManager._decode_number(value)
                     elif key == "s":
-                        state.status_message_id = StateManager._decode_number(value)
+                        fields["status_message_id"] = StateManager._decode_number(value)
                     elif key == "m":
-                        state.promo_message_id = StateManager._decode_number(value)
+                        fields["promo_message_id"] = StateManager._decode_number(value)
                     elif key == "a":
-                        state.show_all_mode = value == "1"
+                        fields["show_all_mode"] = value == "1"
                 except (ValueError, TypeError) as e:
                     logger.warning(f"Failed to parse callback key {key}={value}: {e}")
                 i += 2
             else:
                 i += 1
+        state = BotState(**fields)
 
         if not StateManager.validate_state(state):
             logger.warning(f"Decoded state from callback is invalid: {state}. Returning default BotState.")
@@ -223,7 +241,7 @@ class StateManager:
         if state.show_all_mode:
             data["all"] = 1
 
-        json_str = json.dumps(data, separators=(',', ':'))
+        json_str = _json_dumps(data)
         return f"state_{json_str}"[:64]
     
     @staticmethod
@@ -231,7 +249,7 @@ class StateManager:
         """Decode JSON compressed format"""
         try:
             json_str = callback_data[6:]  # Remove 'state_' prefix
-            data = json.loads(json_str)
+            data = _json_loads(json_str)
             
             action = data.get("a", "")
             state = BotState(
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from telegram import CallbackQuery, Chat, Message, PhotoSize, Update, User
+
+import user_handlers
+from state_manager import StateManager
+
+PROMO = {"id": 1, "text_markdown": "Promo", "link": "", "image_file_id": "sheet-file-id"}
+PROMO_MESSAGE_ID = 10
+
+def make_photo_message(file_id: str, file_unique_id: str) -> Message:
+    return Message(
+        PROMO_MESSAGE_ID, datetime.now(), Chat(1, "private"),
+        photo=[PhotoSize(file_id, file_unique_id, 320, 320)]
+    )
+
+def make_callback_update(message: Message) -> Update:
+    user = User(1, "Test", False)
+    return Update(1, callback_query=CallbackQuery("1", user, "chat", message=message, data="next"))
+
+def run_show_promo(update: Update, edit_response: Message) -> dict:
+    """Run show_promo and return the kwargs it passed to safe_edit_message"""
+    content_manager = MagicMock()
+    content_manager.get_promo_by_id.return_value = PROMO
+    state = StateManager.create_state(promo_id=1, verified_at=0, status_message_id=0, promo_message_id=PROMO_MESSAGE_ID)
+    context = MagicMock(bot_data={"config": MagicMock(default_image_file_id=None)})
+    safe_edit = AsyncMock(return_value=edit_response)
+    with patch.object(user_handlers, "safe_edit_message", safe_edit), \
+         patch.object(user_handlers.KeyboardBuilder, "build_keyboard", return_value=None):
+        asyncio.run(user_handlers.show_promo(update, context, content_manager, "next", state))
+    return safe_edit.call_args.kwargs
+
+def setup_function():
+    user_handlers._image_unique_ids.clear()
+
+def test_unknown_image_edits_media_and_learns_unique_id():
+    # file_id Telegram reports differs from the sheet's, as it may for any new message
+    shown = make_photo_message("telegram-file-id", "unique-1")
+    kwargs = run_show_promo(make_callback_update(shown), edit_response=shown)
+
+    assert kwargs["media"].media == "sheet-file-id"
+    assert user_handlers._image_unique_ids == {"sheet-file-id": "unique-1"}
+
+def test_same_image_edits_caption_only():
+    user_handlers._image_unique_ids["sheet-file-id"] = "unique-1"
+    shown = make_photo_message("another-file-id", "unique-1")
+    kwargs = run_show_promo(make_callback_update(shown), edit_response=shown)
+
+    assert "media" not in kwargs
+    assert kwargs["caption"] == "Promo"
+
+def test_different_image_edits_media():
+    user_handlers._image_unique_ids["sheet-file-id"] = "unique-1"
+    shown = make_photo_message("other-file-id", "unique-2")
+    kwargs = run_show_promo(make_callback_update(shown), edit_response=make_photo_message("x", "unique-1"))
+
+    assert kwargs["media"].media == "sheet-file-id"
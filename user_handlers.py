@@ -1,5 +1,4 @@
 import logging
-import os
 from telegram import Update, InputMediaPhoto
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
@@ -10,11 +9,25 @@ from auth import get_user_info, refresh_admin_verification
 from keyboard_builder import KeyboardBuilder
 from state_manager import BotState, StateManager
 from utils import (
-    check_promos_available, cleanup_chat_messages, get_promo_id_from_promos_index, get_status_emoji, log_update, safe_edit_message, safe_send_message, get_promos_index_from_promo_id, show_admin_promo_status
+    check_promos_available, cleanup_chat_messages, get_promo_id_from_promos_index, get_status_emoji, is_bad_file_id, log_update, safe_edit_message, safe_send_message, get_promos_index_from_promo_id, show_admin_promo_status
 )
 
 logger = logging.getLogger(__name__)
 
+# Sheet image file_id -> file_unique_id of the photo Telegram showed for it
+# file_id is not stable across messages, file_unique_id is - learned from our own sends/edits
+IMAGE_UNIQUE_IDS_MAX = 1024
+_image_unique_ids = {}
+
+def _remember_image(image_file_id: str, response) -> None:
+    """Record the file_unique_id Telegram assigned to image_file_id in a sent/edited promo"""
+    photo = getattr(response, "photo", None)
+    if not image_file_id or not photo:
+        return
+    _image_unique_ids[image_file_id] = photo[-1].file_unique_id
+    if len(_image_unique_ids) > IMAGE_UNIQUE_IDS_MAX:
+        del _image_unique_ids[next(iter(_image_unique_ids))]  # Oldest first
+
 # ===== MAIN USER COMMANDS =====
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager):
@@ -40,10 +53,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, cont
     )
     
     # Check admin status and get verified_at timestamp
-    state = await refresh_admin_verification(state, content_manager, user_id, username)
+    state = await refresh_admin_verification(state, content_manager, context.bot_data["config"].verification_ttl, user_id, username)
     
     if state.verified_at == 0:
-        welcome_text = f"🎉 Привет, {first_name},\nдля вас сегодня доступно {len(content_manager.get_active_promos())} предложений!"
+        welcome_text = f"🎉 Привет, {first_name},\nдля вас сегодня доступно {content_manager.active_count} предложений!"
         # Send welcome message and capture message ID
         state = await show_status(update, state, text=welcome_text)
 
@@ -56,7 +69,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, cont
     state = StateManager.update_state(state, promo_message_id=promo_message_id)
     
     if state.verified_at > 0:
-        welcome_text = f"🎉 Привет, {first_name}, доступно {len(content_manager.get_all_promos())} предложений (активно: {len(content_manager.get_active_promos())})"
+        welcome_text = f"🎉 Привет, {first_name}, доступно {content_manager.total_count} предложений (активно: {content_manager.active_count})"
         welcome_text += f"\nЧтобы добавить новое предложение отправь его в чат"
         # Send welcome message and capture message ID
         state = await show_status(update, state, text=welcome_text)
@@ -93,21 +106,30 @@ async def show_status(update: Update, state, text, parse_mode="Markdown") -> Bot
 
     return state
 
+def _current_promo_message(update: Update, promo_message_id: int):
+    """The promo message as Telegram last showed it, if the callback came from it (else None)"""
+    query = update.callback_query
+    message = query.message if query else None
+    if message and message.message_id == promo_message_id:
+        return message
+    return None
+
+def _shows_image(update: Update, promo_message_id: int, image_file_id: str) -> bool:
+    """True if the promo message (as seen in the callback) already shows image_file_id"""
+    unique_id = _image_unique_ids.get(image_file_id)
+    message = _current_promo_message(update, promo_message_id)
+    return bool(unique_id and message and message.photo and message.photo[-1].file_unique_id == unique_id)
+
 async def show_promo(update: Update, context: ContextTypes.DEFAULT_TYPE, content_manager, action, state: BotState) -> BotState:
     """Display promo using state management"""
-    promos = content_manager.get_all_promos()
-    
     # Find the promo by ID
-    promo = next((p for p in promos if p["id"] == state.promo_id), None)
+    promo = content_manager.get_promo_by_id(state.promo_id)
     if not promo:
         await show_status(update, state, "❌ Не удалось найти это предложение.")
         return state
     
-    # Import escape function
-    from utils import escape_unmatched_markdown
-    
-    # Escape unmatched markdown characters in promo text
-    promo_text = escape_unmatched_markdown(promo.get("text", ""))
+    # Promo text with unmatched markdown characters escaped (precomputed on cache refresh)
+    promo_text = promo.get("text_markdown", "")
     
     # Extract link for keyboard
     promo_link = promo.get("link", "")
@@ -118,56 +140,89 @@ async def show_promo(update: Update, context: ContextTypes.DEFAULT_TYPE, content
     # Validate and clean image_file_id
     image_file_id = promo.get("image_file_id", "")
     has_image = image_file_id and image_file_id.strip() and image_file_id != "None"
+    # Skip file_ids Telegram recently rejected - they would only fail again
+    if has_image and is_bad_file_id(image_file_id):
+        has_image = False
     # Log the image status for debugging
     logger.info(f"Promo {state.promo_id} image status: '{image_file_id}' -> has_image: {has_image}")
     
     # If no image, use bot's description picture
     if not has_image:
-        # Ensure bot image is cached
-        default_image = os.getenv("DEFAULT_IMAGE_FILE_ID")
-        if default_image:
-            image_file_id = default_image
+        default_image_file_id = context.bot_data["config"].default_image_file_id
+        if default_image_file_id:
+            image_file_id = default_image_file_id
             has_image = True
             logger.info(f"Using default image for promo {state.promo_id}")
+        else:
+            # Nothing valid to show as a photo - fall back to a text-only promo
+            image_file_id = ""
     
     
     if state.promo_message_id:
-        # Always use edit_message_media since we always have an image now
-        message_kwargs = {
-            "media": InputMediaPhoto(media=image_file_id, caption=promo_text, parse_mode="Markdown"),
-            "reply_markup": reply_markup,
-            "message_id": state.promo_message_id
-        }
+        if not image_file_id:
+            # No usable picture - keep the message's current media and swap only its text
+            message = _current_promo_message(update, state.promo_message_id)
+            text_key = "text" if message and not message.photo else "caption"
+            message_kwargs = {
+                text_key: promo_text,
+                "parse_mode": "Markdown",
+                "reply_markup": reply_markup,
+                "message_id": state.promo_message_id
+            }
+        elif _shows_image(update, state.promo_message_id, image_file_id):
+            # Same picture already shown - only swap caption and keyboard, no media re-processing
+            message_kwargs = {
+                "caption": promo_text,
+                "parse_mode": "Markdown",
+                "reply_markup": reply_markup,
+                "message_id": state.promo_message_id
+            }
+        else:
+            # Always use edit_message_media since we always have an image now
+            message_kwargs = {
+                "media": InputMediaPhoto(media=image_file_id, caption=promo_text, parse_mode="Markdown"),
+                "reply_markup": reply_markup,
+                "message_id": state.promo_message_id
+            }
         
         logger.info(f"EDITING MESSAGE ID: {state.promo_message_id}")
         response = await safe_edit_message(update, **message_kwargs)
         
         if response:
             # Edit was successful
+            _remember_image(image_file_id, response)
             return state
         else:
             logger.error("Failed to edit promo message")
             await show_status(update, state, "❌ Не удалось обновить чат")
             return state
-    else:
-        # Send new message - always use photo format since we always have an image
+    elif image_file_id:
+        # Send new message in photo format
         message_kwargs = {
             "photo": image_file_id,
             "caption": promo_text,
             "reply_markup": reply_markup,
             "parse_mode": "Markdown"
         }
-        
-        logger.info("SENDING NEW PROMO MESSAGE")
-        response = await safe_send_message(update, **message_kwargs)
-        
-        if response:
-            logger.info(f"NEW PROMO MESSAGE ID: {response.message_id}")
-            return StateManager.update_state(state, promo_message_id=response.message_id)
-        else:
-            logger.error("Failed to send promo message")
-            await show_status(update, state, "❌ Не удалось отправить сообщение")
-            return state
+    else:
+        # No usable picture - send the promo as text
+        message_kwargs = {
+            "text": promo_text,
+            "reply_markup": reply_markup,
+            "parse_mode": "Markdown"
+        }
+    
+    logger.info("SENDING NEW PROMO MESSAGE")
+    response = await safe_send_message(update, **message_kwargs)
+    
+    if response:
+        logger.info(f"NEW PROMO MESSAGE ID: {response.message_id}")
+        _remember_image(image_file_id, response)
+        return StateManager.update_state(state, promo_message_id=response.message_id)
+    else:
+        logger.error("Failed to send promo message")
+        await show_status(update, state, "❌ Не удалось отправить сообщение")
+        return state
 
 # ===== NAVIGATION HANDLERS =====
 
@@ -1,3 +1,5 @@
+import asyncio
+import functools
 import logging
 import json
 import time
@@ -12,6 +14,39 @@ from state_manager import BotState, StateManager
 
 logger = logging.getLogger(__name__)
 
+# ===== CONCURRENCY =====
+
+# Per-chat locks: updates from different chats run concurrently,
+# updates from the same chat are processed in arrival order
+_chat_locks: Dict[int, asyncio.Lock] = {}
+_chat_lock_users: Dict[int, int] = {}
+
+def per_chat_concurrent(handler):
+    """
+    Serialize handler calls per chat while letting other chats run in parallel.
+    Locks are dropped as soon as no update for the chat is pending.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context, *args, **kwargs):
+        chat = update.effective_chat
+        if not chat:
+            return await handler(update, context, *args, **kwargs)
+
+        chat_id = chat.id
+        lock = _chat_locks.setdefault(chat_id, asyncio.Lock())
+        _chat_lock_users[chat_id] = _chat_lock_users.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                return await handler(update, context, *args, **kwargs)
+        finally:
+            _chat_lock_users[chat_id] -= 1
+            if _chat_lock_users[chat_id] == 0:
+                # Nobody else is waiting for this chat - release the lock object
+                del _chat_lock_users[chat_id]
+                _chat_locks.pop(chat_id, None)
+
+    return wrapper
+
 # ===== MARKDOWN ESCAPING =====
 
 def escape_unmatched_markdown(text):
@@ -151,47 +186,62 @@ def escape_unmatched_brackets(text):
 # ===== LOGGING UTILITIES =====
 
 def log_update(update: Update, description: str = ""):
-    """Log detailed information about an Update object"""
+    """
+    Log an Update object: one INFO summary line always,
+    full details only when DEBUG is enabled
+    """
     try:
-        logger.info(f"=== {description} UPDATE LOG ===")
-        logger.info(f"Update ID: {update.update_id}")
+        user = update.effective_user
+        logger.info(
+            "%s: update_id=%s user_id=%s data=%s",
+            description, update.update_id, user.id if user else None,
+            update.callback_query.data if update.callback_query else None
+        )
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        
+        logger.debug(f"=== {description} UPDATE LOG ===")
+        logger.debug(f"Update ID: {update.update_id}")
         
         # Log message details
         if update.message:
             msg = update.message
-            logger.info(f"MESSAGE:")
-            logger.info(f"  Message ID: {msg.message_id}")
-            logger.info(f"  From: {msg.from_user.id} (@{msg.from_user.username}) - {msg.from_user.first_name}")
-            logger.info(f"  Chat: {msg.chat.id} ({msg.chat.type})")
-            logger.info(f"  Text: {msg.text}")
-            logger.info(f"  Caption: {msg.caption}")
+            logger.debug(f"MESSAGE:")
+            logger.debug(f"  Message ID: {msg.message_id}")
+            logger.debug(f"  From: {msg.from_user.id} (@{msg.from_user.username}) - {msg.from_user.first_name}")
+            logger.debug(f"  Chat: {msg.chat.id} ({msg.chat.type})")
+            logger.debug(f"  Text: {msg.text}")
+            logger.debug(f"  Caption: {msg.caption}")
             if msg.photo:
-                logger.info(f"  Photo: {len(msg.photo)} sizes, largest: {msg.photo[-1].file_id}")
+                logger.debug(f"  Photo: {len(msg.photo)} sizes, largest: {msg.photo[-1].file_id}")
             if msg.entities:
-                logger.info(f"  Entities: {[(e.type, e.offset, e.length) for e in msg.entities]}")
+                logger.debug(f"  Entities: {[(e.type, e.offset, e.length) for e in msg.entities]}")
         
         # Log callback query details
         if update.callback_query:
             cb = update.callback_query
-            logger.info(f"CALLBACK QUERY:")
-            logger.info(f"  Query ID: {cb.id}")
-            logger.info(f"  From: {cb.from_user.id} (@{cb.from_user.username}) - {cb.from_user.first_name}")
-            logger.info(f"  Data: {cb.data}")
+            logger.debug(f"CALLBACK QUERY:")
+            logger.debug(f"  Query ID: {cb.id}")
+            logger.debug(f"  From: {cb.from_user.id} (@{cb.from_user.username}) - {cb.from_user.first_name}")
+            logger.debug(f"  Data: {cb.data}")
             if cb.message:
-                logger.info(f"  Message ID: {cb.message.message_id}")
-                logger.info(f"  Message Text/Caption: {cb.message.text or cb.message.caption}")
+                logger.debug(f"  Message ID: {cb.message.message_id}")
+                logger.debug(f"  Message Text/Caption: {cb.message.text or cb.message.caption}")
         
-        logger.info(f"=== END UPDATE LOG ===")
+        logger.debug(f"=== END UPDATE LOG ===")
         
     except Exception as e:
         logger.error(f"Error logging update: {e}")
 
-def log_response(response_data: dict, description: str = ""):
-    """Log detailed response information"""
+def log_response(response, description: str = ""):
+    """
+    Log a Bot API response (DEBUG only)
+    This is the only DEBUG check: to_dict() walks the whole Message tree, so it is built only when it will be logged
+    """
+    if not response or not logger.isEnabledFor(logging.DEBUG):
+        return
     try:
-        logger.info(f"=== {description} RESPONSE LOG ===")
-        logger.info(f"Response: {json.dumps(response_data, indent=2, default=str)}")
-        logger.info(f"=== END RESPONSE LOG ===")
+        logger.debug("%s RESPONSE: %s", description, json.dumps(response.to_dict(), default=str))
     except Exception as e:
         logger.error(f"Error logging response: {e}")
         
@@ -209,6 +259,28 @@ def format_promo_text(promo: Dict, include_status: bool = False) -> str:
     
     return text
 
+def format_admin_summary(content_manager: ContentManager, max_count: int = 10) -> str:
+    """
+    Format a short list of all promos (one line per promo) for admins
+    Result is cached in content_manager until the next cache refresh
+    """
+    summary = content_manager.summary_cache.get(max_count)
+    if summary is not None:
+        return summary
+
+    all_promos = content_manager.get_all_promos()
+    summary = ""
+    for promo in all_promos[:max_count]:
+        status_emoji = get_status_emoji(promo.get("status", "unknown"))
+        promo_text = truncate_text(promo.get("text", "No text"), 40)
+        summary += f"\n{status_emoji} ID {promo.get('id', '?')}: {promo_text}"
+
+    if len(all_promos) > max_count:
+        summary += f"\n... и ещё {len(all_promos) - max_count}"
+
+    content_manager.summary_cache[max_count] = summary
+    return summary
+
 def truncate_text(text: str, max_length: int = 100) -> str:
     """Safely truncate text to specified length"""
     if not text:
@@ -220,28 +292,66 @@ def truncate_text(text: str, max_length: int = 100) -> str:
     
     return text_str[:max_length] + "..."
 
-def extract_link_from_entities(text: str, entities: List) -> str:
-    """Extract URL from message entities"""
-    if not text or not entities:
-        return ""
-    
-    for entity in entities:
-        if entity.type == "url":
-            return text[entity.offset:entity.offset + entity.length]
+# First bare URL in promo text, used when the message has no url entities
+URL_PATTERN = re.compile(r'https?://[^\s]+')
+
+def _first_url(message) -> str:
+    """Extract first URL from text or caption entities (text_link buttons included)"""
+    for entities, parse in ((message.entities, message.parse_entity),
+                            (message.caption_entities, message.parse_caption_entity)):
+        for entity in entities or ():
+            if entity.type == "url":
+                # parse_* handles Telegram's UTF-16 offsets (emoji before the link)
+                return parse(entity)
+            if entity.type == "text_link" and entity.url:
+                return entity.url
     
     return ""
 
+STATUS_EMOJI = {
+    "active": "✅",
+    "draft": "📄", 
+    "inactive": "❌"
+}
+
 def get_status_emoji(status: str) -> str:
     """Get emoji for promo status"""
-    emoji_map = {
-        "active": "✅",
-        "draft": "📄", 
-        "inactive": "❌"
-    }
-    return emoji_map.get(status, "❓")
+    return STATUS_EMOJI.get(status, "❓")
 
 # ===== ERROR HANDLING =====
 
+# Image file_ids Telegram rejected recently: file_id -> time it was rejected
+# Known-bad ids are skipped until the TTL passes instead of failing a round-trip every time
+BAD_FILE_ID_TTL = 3600  # 1 hour
+BAD_FILE_ID_MAX = 256   # Oldest entries are dropped beyond this, so the dict can't grow for the life of the process
+_bad_file_ids: Dict[str, float] = {}
+
+def mark_bad_file_id_on_error(error: TelegramError, kwargs: Dict) -> None:
+    """Remember the photo file_id of a failed send/edit if Telegram rejected the file identifier"""
+    if "file identifier" not in str(error).lower():
+        return
+    file_id = kwargs.get("photo") or getattr(kwargs.get("media"), "media", None)
+    if isinstance(file_id, str) and file_id:
+        now = time.time()
+        _bad_file_ids.pop(file_id, None)  # Re-insert at the end - dict order is oldest first
+        _bad_file_ids[file_id] = now
+        # Expired ids are at the front; drop them, then anything past the size cap
+        for old_id, marked_at in list(_bad_file_ids.items()):
+            if now - marked_at <= BAD_FILE_ID_TTL and len(_bad_file_ids) <= BAD_FILE_ID_MAX:
+                break
+            del _bad_file_ids[old_id]
+        logger.warning(f"Marked image file_id as bad for {BAD_FILE_ID_TTL}s: {file_id}")
+
+def is_bad_file_id(file_id: str) -> bool:
+    """Check if file_id was rejected by Telegram within the last BAD_FILE_ID_TTL seconds"""
+    marked_at = _bad_file_ids.get(file_id)
+    if marked_at is None:
+        return False
+    if time.time() - marked_at > BAD_FILE_ID_TTL:
+        del _bad_file_ids[file_id]  # Expired - allow a retry
+        return False
+    return True
+
 async def safe_edit_message(update: Update, **kwargs):
     """Safely edit message with error handling - returns message object or None"""
     try:
@@ -254,7 +364,8 @@ async def safe_edit_message(update: Update, **kwargs):
         bot = update.get_bot()
         chat_id = update.effective_chat.id
         
-        logger.info(f"Editing message {message_id} in chat {chat_id} with kwargs: {kwargs}")
+        logger.info("Editing message %s in chat %s", message_id, chat_id)
+        logger.debug("Edit kwargs: %s", kwargs)
         
         if "media" in kwargs:
             response = await bot.edit_message_media(
@@ -268,16 +379,22 @@ async def safe_edit_message(update: Update, **kwargs):
                 message_id=message_id, 
                 **kwargs
             )
+        elif "caption" in kwargs:
+            response = await bot.edit_message_caption(
+                chat_id=chat_id, 
+                message_id=message_id, 
+                **kwargs
+            )
         else:
-            logger.error("No text or media provided for edit")
+            logger.error("No text, caption or media provided for edit")
             return None
         
-        if response:
-            log_response(response.to_dict(), "SAFE EDIT MESSAGE")
+        log_response(response, "SAFE EDIT MESSAGE")
         return response
         
     except TelegramError as e:
         logger.error(f"Failed to edit message {message_id}: {e}")
+        mark_bad_file_id_on_error(e, kwargs)
         return None
 
 async def safe_send_message(update: Update, **kwargs):
@@ -291,12 +408,12 @@ async def safe_send_message(update: Update, **kwargs):
             logger.error("No text or photo provided for send")
             return None
         
-        if response:
-            log_response(response.to_dict(), "SAFE SEND MESSAGE")
+        log_response(response, "SAFE SEND MESSAGE")
         return response  # Return the actual message object
         
     except TelegramError as e:
         logger.error(f"Failed to send message: {e}")
+        mark_bad_file_id_on_error(e, kwargs)
         return None
 
 def handle_telegram_error(error: TelegramError, context: str = "") -> str:
@@ -330,22 +447,18 @@ def extract_message_components(message) -> Dict[str, str]:
     if message.photo:
         components["image_file_id"] = message.photo[-1].file_id
     
-    # Extract link from entities (works for text messages, not captions)
-    if message.entities:
-        components["link"] = extract_link_from_entities(components["text"], message.entities)
+    # Extract link from entities (text or caption)
+    components["link"] = _first_url(message)
     
-    # Fallback: extract first URL from text using regex (works for both text and captions)
+    # Fallback: extract first URL from text using regex
     if not components["link"] and components["text"]:
-        import re
-        url_pattern = r'https?://[^\s]+'
-        urls = re.findall(url_pattern, components["text"])
-        if urls:
-            components["link"] = urls[0]
+        match = URL_PATTERN.search(components["text"])
+        if match:
+            components["link"] = match.group(0)
     
     # Clean up: remove the extracted link from text to avoid duplication
     if components["link"] and components["text"]:
         # Remove the link from text (with surrounding whitespace)
-        import re
         link_escaped = re.escape(components["link"])
         # Remove link with optional surrounding whitespace/newlines
         components["text"] = re.sub(r'\s*' + link_escaped + r'\s*', '', components["text"])
@@ -449,7 +562,7 @@ async def check_promos_available(update: Update, state: BotState, content_manage
         - In active mode: active promos only, but can see all if no active
     Returns updated state with first available promo_id, or original state if none found
     """
-    # Buffer current position before refreshing cache
+    # Buffer current position in the current mode
     current_index = 0
     if preserve_position and state.promo_id > 0:
         if state.show_all_mode:
@@ -459,8 +572,6 @@ async def check_promos_available(update: Update, state: BotState, content_manage
         
         current_index = get_promos_index_from_promo_id(state.promo_id, current_promos)
     
-    await content_manager.refresh_cache()
-    
     is_admin = state.verified_at > 0
     
     if is_admin and state.show_all_mode:
@@ -491,16 +602,9 @@ async def check_promos_available(update: Update, state: BotState, content_manage
                              "изображением и ссылкой.")
 
         else:
-            all_promos = content_manager.get_all_promos()
             # Admin in "active only" mode but no active promos
             no_promos_text = "📭 Нет активных предложений.\n\n📋 Список всех предложений:"
-            for promo in all_promos[:10]:  # Limit to 10 to avoid long messages
-                status_emoji = get_status_emoji(promo.get("status", "unknown"))
-                promo_text = truncate_text(promo.get("text", "No text"), 40)
-                no_promos_text += f"\n{status_emoji} ID {promo.get('id', '?')}: {promo_text}"
-
-            if len(promos) > 10:
-                no_promos_text += f"\n... и ещё {len(promos) - 10}"
+            no_promos_text += format_admin_summary(content_manager, max_count=10)  # Limit to 10 to avoid long messages
             no_promos_text += "\n\n💡 Нажми '👁️ Активные' чтобы переключиться на все предложения"
 
     else:
@@ -532,11 +636,11 @@ async def cleanup_chat_messages(update):
     
     logger.info(f"CLEANUP: Attempting to delete messages {messages_to_delete} from chat {chat_id}")
     
-    # Skip batch delete - go straight to individual deletions with proper error handling
+    # Individual deletions sent concurrently, each with its own error handling
     successful_deletes = []
     failed_deletes = []
     
-    for msg_id in messages_to_delete:
+    async def delete_one(msg_id):
         try:
             await bot.delete_message(chat_id=chat_id, message_id=msg_id)
             successful_deletes.append(msg_id)
@@ -545,6 +649,8 @@ async def cleanup_chat_messages(update):
             failed_deletes.append((msg_id, str(e)))
             logger.debug(f"CLEANUP: Could not delete message {msg_id} from chat {chat_id}: {e}")
     
+    await asyncio.gather(*(delete_one(msg_id) for msg_id in messages_to_delete))
+    
     logger.info(f"CLEANUP: Successfully deleted {len(successful_deletes)} messages: {successful_deletes}")
     if failed_deletes:
         logger.debug(f"CLEANUP: Failed to delete {len(failed_deletes)} messages (expected for new chats): {[msg_id for msg_id, _ in failed_deletes]}")